@@ -11,16 +11,23 @@ Environment Variables:
 """
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 import collections
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import functools
+import itertools
+import json
 import logging
 import os
 import sys
+from threading import BoundedSemaphore
 
 import boto3
+import botocore.session
 from aws_assume_role_lib import (  # pylint: disable=import-error
     assume_role,
     generate_lambda_session_name,
 )
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import ClientError, UnknownRegionError
 
 # Standard logging config
 DEFAULT_LOG_LEVEL = logging.INFO
@@ -38,6 +45,15 @@ CLOUDTRAIL_NAME_PREFIX = os.getenv("CLOUDTRAIL_NAME_PREFIX", "cloudtrail-")
 ERROR_NOT_FOUND = bool(os.getenv("ERROR_NOT_FOUND", "true").lower() == "true")
 DRY_RUN = os.environ.get("DRY_RUN", "true").lower() == "true"
 ASSUME_ROLE_NAME = os.environ.get("ASSUME_ROLE_NAME", "OrganizationAccountAccessRole")
+# Assumed role sessions kept for reuse across warm invocations; events are
+# usually for a new account each time, so only a few are worth keeping
+ASSUMED_ROLE_SESSION_CACHE_SIZE = 4
+# Maximum number of keys accepted by a single s3 DeleteObjects request
+S3_DELETE_BATCH_SIZE = 1000
+S3_PAGINATION_CONFIG = {"PageSize": S3_DELETE_BATCH_SIZE}
+# Concurrent s3 DeleteObjects requests, and batches allowed to queue for them
+S3_DELETE_MAX_WORKERS = 10
+S3_DELETE_MAX_PENDING = 32
 
 # Lambda initializes a root logger that needs to be removed in order to set a
 # different logging config
@@ -54,8 +70,39 @@ logging.basicConfig(
 
 log = logging.getLogger(__name__)
 
-# Get the Lambda session and clients
-SESSION = boto3.Session()
+
+@functools.lru_cache(maxsize=1)
+def get_botocore_session():
+    """Return the Lambda/CLI botocore session, created on first use."""
+    return botocore.session.get_session()
+
+
+@functools.lru_cache(maxsize=1)
+def get_session():
+    """Return the Lambda/CLI boto3 session, created on first use."""
+    # Wrap the botocore session so credentials are only resolved once
+    return boto3.Session(botocore_session=get_botocore_session())
+
+
+@functools.lru_cache(maxsize=1)
+def get_boto3_config():
+    """Return the config shared by all boto3 clients, created on first use."""
+    # The s3 client is used by every delete worker plus the thread listing the
+    # bucket, so size the pool to keep all of their connections alive, and use
+    # adaptive retries to rate limit the client when s3 responds with SlowDown
+    # throttling errors
+    return Config(
+        max_pool_connections=S3_DELETE_MAX_WORKERS + 1,
+        connect_timeout=5,
+        read_timeout=30,
+        retries={"mode": "adaptive", "max_attempts": 10},
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def get_sts_client():
+    """Return the sts client for the Lambda/CLI session, created on first use."""
+    return get_botocore_session().create_client("sts", config=get_boto3_config())
 
 
 class NoCloudtrailsFoundError(Exception):
@@ -72,7 +119,8 @@ class DeleteDefaultCloudtrailError(Exception):
 
 def lambda_handler(event, context):  # pylint: disable=unused-argument
     """Delete the default cloudtrail and s3 bucket."""
-    log.debug("AWS Event:%s", event)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("AWS Event:%s", json.dumps(event))
 
     account_id = get_account_id(event)
 
@@ -89,6 +137,8 @@ def delete_cloudtrail_resources(assume_role_arn, account_id):
 
     if cloudtrail:
         if not DRY_RUN:
+            # The bucket is only emptied once the trail is stopped and deleted, so
+            # a failure on the trail side never deletes the logs
             delete_cloudtrail(cloudtrail["Trail"]["TrailARN"], cloudtrail_client)
             delete_s3_bucket(cloudtrail["Trail"]["S3BucketName"], s3_client)
         else:
@@ -105,19 +155,31 @@ def get_cloudtrail(client, prefix):
     """Find the cloudtrail by prefix."""
     # Get the cloudtrail by prefix
     matching_trails = []
+    # get_trail response for the match, when already fetched by the region check
+    matching_trail = None
     try:
-        cloudtrails = client.describe_trails(trailNameList=[])
-        for trail in cloudtrails["trailList"]:
-            if trail["Name"].startswith(prefix):
-                matching_trails.append(trail["Name"])
-
-        if len(matching_trails) > 1:
-            multiple_found_error = (
-                f"Multiple ({len(matching_trails)}) "
-                f"cloudtrails found: {prefix}, {matching_trails}"
-            )
-            log.error(multiple_found_error)
-            raise MultipleCloudtrailsFoundError(multiple_found_error)
+        paginator = client.get_paginator("list_trails")
+        for page in paginator.paginate():
+            for trail in page["Trails"]:
+                if not trail["Name"].startswith(prefix):
+                    continue
+
+                if trail["HomeRegion"] != client.meta.region_name:
+                    matching_trail = get_multi_region_cloudtrail(
+                        client, trail["TrailARN"]
+                    )
+                    if not matching_trail:
+                        continue
+                matching_trails.append(trail["TrailARN"])
+
+                # Stop as soon as the prefix is known to be ambiguous
+                if len(matching_trails) > 1:
+                    multiple_found_error = (
+                        f"Multiple ({len(matching_trails)}) "
+                        f"cloudtrails found: {prefix}, {matching_trails}"
+                    )
+                    log.error(multiple_found_error)
+                    raise MultipleCloudtrailsFoundError(multiple_found_error)
 
         if len(matching_trails) == 0:
             none_found_error = f"No cloudtrail found for prefix {prefix}"
@@ -127,6 +189,9 @@ def get_cloudtrail(client, prefix):
             log.warning(none_found_error)
             return None
 
+        if matching_trail:
+            return matching_trail
+        # Fetch by ARN, as trails are listed from every region
         return client.get_trail(Name=matching_trails[0])
 
     except ClientError as err:
@@ -136,6 +201,16 @@ def get_cloudtrail(client, prefix):
         ) from err
 
 
+def get_multi_region_cloudtrail(client, cloudtrail_arn):
+    """Return the trail homed in another region if it is multi-region, else None."""
+    # Trails homed in other regions only apply here when they are multi-region
+    try:
+        response = client.get_trail(Name=cloudtrail_arn)
+    except client.exceptions.TrailNotFoundException:
+        return None
+    return response if response["Trail"]["IsMultiRegionTrail"] else None
+
+
 def delete_cloudtrail(cloudtrail_arn, client):
     """Stop and Delete the cloudtrail for the arn provided."""
     # Stop logging to the trail
@@ -159,22 +234,92 @@ def get_boto3_clients(assume_role_arn, account_id):
     # Assume the session
     assumed_role_session = get_assumed_role_session(account_id, assume_role_arn)
     # Create the cloudtrail and s3 clients
-    cloudtrail_client = assumed_role_session.client("cloudtrail")
-    s3_client = assumed_role_session.client("s3")
+    config = get_boto3_config()
+    cloudtrail_client = assumed_role_session.client("cloudtrail", config=config)
+    s3_client = assumed_role_session.client("s3", config=config)
     return cloudtrail_client, s3_client
 
 
 def delete_s3_objects(bucket_name, client):
-    """Delete all objects from the s3 bucket."""
-    # Get all objects from the s3 bucket
-    objects = client.list_objects_v2(Bucket=bucket_name)["Contents"]
-    # Delete all objects from the s3 bucket
-    for obj in objects:
-        client.delete_object(Bucket=bucket_name, Key=obj["Key"])
+    """Delete all objects and object versions from the s3 bucket."""
+    # Check for any object, version or delete marker before listing everything
+    response = client.list_object_versions(Bucket=bucket_name, MaxKeys=1)
+    if not response.get("Versions") and not response.get("DeleteMarkers"):
+        log.debug("S3 bucket %s is already empty.", bucket_name)
+        return
+
+    with ThreadPoolExecutor(max_workers=S3_DELETE_MAX_WORKERS) as executor:
+        errors = delete_s3_object_batches(
+            executor,
+            bucket_name,
+            list_s3_object_version_batches(bucket_name, client),
+            client,
+        )
+
+    if errors:
+        log.error("Errors deleting objects from s3 bucket %s: %s", bucket_name, errors)
+        raise DeleteDefaultCloudtrailError(
+            f"Error deleting {len(errors)} objects from s3 bucket {bucket_name}"
+        )
 
     log.debug("All objects from s3 bucket %s have been deleted.", bucket_name)
 
 
+def list_s3_object_version_batches(bucket_name, client):
+    """Return an iterator of batches of the object versions and delete markers."""
+    # Unversioned objects are listed as versions with a "null" version id, so
+    # this also covers buckets that never had versioning enabled
+    paginator = client.get_paginator("list_object_versions")
+    pages = paginator.paginate(
+        Bucket=bucket_name, PaginationConfig=S3_PAGINATION_CONFIG
+    )
+    return chunk_s3_objects(
+        {"Key": obj["Key"], "VersionId": obj["VersionId"]}
+        for page in pages
+        for obj in itertools.chain(
+            page.get("Versions", []), page.get("DeleteMarkers", [])
+        )
+    )
+
+
+def chunk_s3_objects(objects):
+    """Yield lists of up to S3_DELETE_BATCH_SIZE objects from the objects iterator."""
+    # Only the batch being filled is held in memory, regardless of bucket size
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == S3_DELETE_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def delete_s3_object_batches(executor, bucket_name, batches, client):
+    """Delete the batches of s3 objects concurrently and return any errors."""
+    # Cap the pending requests so listing cannot run far ahead of deletion
+    pending = BoundedSemaphore(S3_DELETE_MAX_PENDING)
+    futures = []
+    for batch in batches:
+        pending.acquire()  # pylint: disable=consider-using-with
+        future = executor.submit(delete_s3_object_batch, bucket_name, batch, client)
+        future.add_done_callback(lambda _: pending.release())
+        futures.append(future)
+
+    errors = []
+    for future in as_completed(futures):
+        errors.extend(future.result())
+    return errors
+
+
+def delete_s3_object_batch(bucket_name, batch, client):
+    """Delete a batch of up to S3_DELETE_BATCH_SIZE s3 objects and return any errors."""
+    response = client.delete_objects(
+        Bucket=bucket_name, Delete={"Objects": batch, "Quiet": True}
+    )
+    return response.get("Errors", [])
+
+
 def get_new_account_id(event):
     """Return account id for new account events."""
     return event["detail"]["serviceEventDetails"]["createAccountStatus"]["accountId"]
@@ -188,15 +333,16 @@ def get_invite_account_id(event):
 def get_account_id(event):
     """Return account id for supported events."""
     event_name = event["detail"]["eventName"]
-    get_account_id_strategy = {
-        "CreateAccountResult": get_new_account_id,
-        "InviteAccountToOrganization": get_invite_account_id,
-    }
-    return get_account_id_strategy[event_name](event)
+    if event_name == "CreateAccountResult":
+        return get_new_account_id(event)
+    if event_name == "InviteAccountToOrganization":
+        return get_invite_account_id(event)
+    raise KeyError(event_name)
 
 
+@functools.lru_cache(maxsize=ASSUMED_ROLE_SESSION_CACHE_SIZE)
 def get_assumed_role_session(account_id, role_arn):
-    """Get boto3 session."""
+    """Get boto3 session, reusing a recently assumed session for the role."""
     function_name = os.environ.get(
         "AWS_LAMBDA_FUNCTION_NAME", os.path.basename(__file__)
     )
@@ -205,21 +351,34 @@ def get_assumed_role_session(account_id, role_arn):
 
     # Assume the session
     assumed_role_session = assume_role(
-        SESSION, role_arn, RoleSessionName=role_session_name, validate=False
-    )
-    # do stuff with the assumed role using assumed_role_session
-    log.debug(
-        "Assumed identity for account %s is %s",
-        account_id,
-        assumed_role_session.client("sts").get_caller_identity()["Arn"],
+        get_session(), role_arn, RoleSessionName=role_session_name, validate=False
     )
+    # Only look up the assumed identity when it will actually be logged
+    if log.isEnabledFor(logging.DEBUG):
+        sts = assumed_role_session.client("sts", config=get_boto3_config())
+        log.debug(
+            "Assumed identity for account %s is %s",
+            account_id,
+            sts.get_caller_identity()["Arn"],
+        )
+
+    # The assumed role credentials refresh themselves before they expire, so
+    # the session is safe to keep cached
     return assumed_role_session
 
 
+@functools.lru_cache(maxsize=1)
 def get_partition():
-    """Return AWS partition."""
-    sts = boto3.client("sts")
-    return sts.get_caller_identity()["Arn"].split(":")[1]
+    """Return AWS partition, cached as it does not change during execution."""
+    # Derive the partition from the region when it is known (always in Lambda)
+    region = os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION")
+    if region:
+        try:
+            return get_botocore_session().get_partition_for_region(region)
+        except UnknownRegionError:
+            log.debug("No partition known for region %s, using sts", region)
+
+    return get_sts_client().get_caller_identity()["Arn"].split(":")[1]
 
 
 def cli_main(target_account_id, assume_role_arn=None, assume_role_name=None):
@@ -242,10 +401,9 @@ def cli_main(target_account_id, assume_role_arn=None, assume_role_name=None):
 
 def main(target_account_id, assume_role_arn):
     """Assume role and delete cloudtrail resources."""
-    log.debug(
-        "Main identity is %s",
-        SESSION.client("sts").get_caller_identity()["Arn"],
-    )
+    # Only look up the main identity when it will actually be logged
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Main identity is %s", get_sts_client().get_caller_identity()["Arn"])
 
     delete_cloudtrail_resources(
         assume_role_arn,
@@ -35,7 +35,7 @@ data "aws_partition" "current" {}
 data "aws_iam_policy_document" "iam_cloudtrail" {
   statement {
     actions = [
-      "cloudtrail:DescribeTrails",
+      "cloudtrail:ListTrails",
       "cloudtrail:GetTrail",
     ]
 
@@ -57,8 +57,10 @@ data "aws_iam_policy_document" "iam_cloudtrail" {
   statement {
     actions = [
       "s3:ListBucket",
+      "s3:ListBucketVersions",
       "s3:GetObject",
       "s3:DeleteObject",
+      "s3:DeleteObjectVersion",
       "s3:DeleteBucket"
     ]
 